@@ -12,18 +12,27 @@ import uuid
 import sqlite3
 import json
 import csv
+import hashlib
 import io
 import bcrypt
+import atexit
+import queue
 import threading
 import requests as http_requests
+from cachetools import TTLCache
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
 from functools import wraps
 from flask import (Flask, render_template, request, redirect, url_for,
-                   jsonify, flash, session, send_file, g)
+                   jsonify, flash, session, send_file, g,
+                   get_flashed_messages, stream_with_context, make_response)
 import firebase_admin
 from firebase_admin import credentials, firestore
+from google.cloud.firestore_v1.base_query import FieldFilter
 import os
 import logging
+from logging.handlers import QueueHandler, QueueListener
 
 # ─── ReportLab (PDF) ────────────────────────────────────────────────────────
 try:
@@ -43,15 +52,22 @@ app.secret_key = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-producti
 # ─── Logging ─────────────────────────────────────────────────────────────────
 # On Railway (and other cloud platforms) write only to stdout;
 # locally also write to app.log for convenience.
+# Handlers run on a background listener thread; request threads only enqueue.
+_log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 _log_handlers = [logging.StreamHandler()]
 if not os.environ.get('RAILWAY_ENVIRONMENT'):
     _log_handlers.append(logging.FileHandler('app.log'))
+for _handler in _log_handlers:
+    _handler.setFormatter(_log_formatter)
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=_log_handlers
-)
+_log_queue = queue.Queue(-1)
+log_listener = QueueListener(_log_queue, *_log_handlers, respect_handler_level=True)
+log_listener.start()
+atexit.register(log_listener.stop)
+
+_root_logger = logging.getLogger()
+_root_logger.setLevel(logging.INFO)
+_root_logger.addHandler(QueueHandler(_log_queue))
 logger = logging.getLogger(__name__)
 
 # ─── Medical code validation ─────────────────────────────────────────────────
@@ -67,6 +83,13 @@ def init_sqlite():
     conn = sqlite3.connect(SQLITE_PATH)
     cursor = conn.cursor()
 
+    # WAL is persistent in the db file; the pool re-applies per-connection pragmas
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=30000")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA cache_size=-64000")
+
     # Patients table (personal + medical code)
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS patients (
@@ -261,6 +284,15 @@ def init_sqlite():
         )
     """)
 
+    # ── Indexes for hot lookups (patients.uuid is already indexed via UNIQUE)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_referrals_recipient ON referral_messages(recipient_id, is_read)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_referrals_sender ON referral_messages(sender_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_partograph_cases_patient ON partograph_cases(patient_uuid)")
+    for table in ('fhr_entries', 'cervix_entries', 'descent_entries', 'moulding_entries',
+                  'contraction_entries', 'amniotic_fluid_entries', 'vital_sign_entries',
+                  'temperature_entries', 'medication_entries', 'urine_entries'):
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_case ON {table}(case_id, time)")
+
     conn.commit()
     conn.close()
     logger.info("SQLite database initialised / migrated OK")
@@ -287,6 +319,23 @@ except Exception as e:
     logger.error(f"Firebase initialisation failed: {e}")
     db_firestore = None
 
+# Collection handle built once and shared by every route
+MEDICAL_COL = db_firestore.collection('patients_medical') if db_firestore else None
+
+def _warm_firestore() -> None:
+    """
+    Background thread: issue one tiny read so the gRPC channel, TLS session and
+    OAuth token are set up before the first real request needs them.
+    """
+    try:
+        MEDICAL_COL.limit(1).get(timeout=15)
+        logger.info("Firestore channel warmed up")
+    except Exception as exc:
+        logger.warning(f"Firestore warm-up failed: {exc}")
+
+if MEDICAL_COL is not None:
+    threading.Thread(target=_warm_firestore, daemon=True).start()
+
 # ─── Helpers ─────────────────────────────────────────────────────────────────
 SQLITE_PATH = os.environ.get('SQLITE_PATH', 'db_local.sqlite')
 # Auto-create directory for SQLite (needed when using Render persistent disk)
@@ -302,12 +351,101 @@ if _sqlite_dir and not os.path.exists(_sqlite_dir):
 # Initialise tables on startup
 init_sqlite()
 
-def get_sqlite_connection():
-    return sqlite3.connect(SQLITE_PATH)
+# ─── SQLite Connection Pool ──────────────────────────────────────────────────
+class SQLitePool:
+    """
+    Long-lived SQLite connections shared by all request threads.
+    One dedicated writer (serialised by a lock) plus `size` readers, so a
+    request borrows an already-open handle instead of re-opening the db,
+    -wal and -shm files every time.
+    """
+
+    def __init__(self, path, size=8):
+        self.path = path
+        self._readers = queue.Queue(maxsize=size)
+        for _ in range(size):
+            self._readers.put(self._connect())
+        self._writer = self._connect()
+        self._write_lock = threading.RLock()
+
+    def _connect(self):
+        # Room for every patient, partograph and referral statement per connection
+        conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=256)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA busy_timeout=30000')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute('PRAGMA cache_size=-64000')
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @staticmethod
+    def _release(conn):
+        # Never hand the next borrower a half-finished transaction
+        if conn.in_transaction:
+            conn.rollback()
+
+    @contextmanager
+    def acquire(self, write=False):
+        """Borrow a connection: the shared writer if `write`, otherwise a reader."""
+        if write:
+            with self._write_lock:
+                try:
+                    yield self._writer
+                finally:
+                    self._release(self._writer)
+            return
+        conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+            self._readers.put(conn)
+
+
+pool = SQLitePool(SQLITE_PATH, size=int(os.environ.get('SQLITE_POOL_SIZE', 8)))
+
+# ─── Firestore Read Caches ───────────────────────────────────────────────────
+# Short-lived, per-process caches so repeated page loads don't re-read the
+# whole collection. Cleared whenever this process writes patient data.
+dashboard_cache = TTLCache(maxsize=64, ttl=10)      # (cursor, page_size) → page
+medical_data_cache = TTLCache(maxsize=1, ttl=60)    # bulk /api/medical-data payload
+patient_doc_cache = TTLCache(maxsize=1024, ttl=10)  # uuid → medical document
+_cache_lock = threading.Lock()
+
+def invalidate_medical_caches(patient_uuid=None):
+    with _cache_lock:
+        dashboard_cache.clear()
+        medical_data_cache.clear()
+        if patient_uuid:
+            patient_doc_cache.pop(patient_uuid, None)
+
+# Runs the independent SQLite and Firestore halves of a split write side by side
+executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='split-write')
 
 def create_uuid():
     return str(uuid.uuid4())
 
+# ─── Patient SQL ─────────────────────────────────────────────────────────────
+# Fixed statement text, so each pooled connection prepares these once and
+# serves every later execute from its statement cache.
+SQL_INSERT_PATIENT = (
+    'INSERT OR IGNORE INTO patients (uuid, medical_code, full_name, phone, email) '
+    'VALUES (?, ?, ?, ?, ?) RETURNING id'
+)
+SQL_SELECT_BY_UUID = (
+    'SELECT id, uuid, medical_code, full_name, phone, email, created_at '
+    'FROM patients WHERE uuid = ? LIMIT 1'
+)
+SQL_DELETE_BY_UUID = 'DELETE FROM patients WHERE uuid = ?'
+SQL_COUNT_PATIENTS = 'SELECT COUNT(*) FROM patients'
+
+def get_patient_by_uuid(patient_uuid):
+    """Return the local (personal) patient record as a dict, or None."""
+    with pool.acquire() as conn:
+        row = conn.execute(SQL_SELECT_BY_UUID, (patient_uuid,)).fetchone()
+    return dict(row) if row else None
+
 # ─── Risk-Score API Integration ──────────────────────────────────────────────
 RISK_API_URL = os.environ.get('RISK_API_URL', '').rstrip('/')
 
@@ -324,6 +462,7 @@ def _call_risk_api(patient_uuid: str) -> None:
         url = f"{RISK_API_URL}/api/firestore/score-patient/{patient_uuid}"
         resp = http_requests.post(url, timeout=30)
         if resp.ok:
+            invalidate_medical_caches(patient_uuid)
             data = resp.json()
             logger.info(
                 "Auto-scored patient %s → %.1f (%s)",
@@ -339,24 +478,24 @@ def trigger_risk_score(patient_uuid: str) -> None:
     t = threading.Thread(target=_call_risk_api, args=(patient_uuid,), daemon=True)
     t.start()
 
+PERSONAL_FIELDS = frozenset({'full_name', 'name', 'phone', 'email', 'contact', 'address'})
+
 def verify_no_personal_data(data_dict):
-    personal_fields = ['full_name', 'name', 'phone', 'email', 'contact', 'address']
-    for field in personal_fields:
-        if field in data_dict:
-            logger.error(f"SECURITY VIOLATION: Personal field '{field}' attempted in Firebase data")
-            return False
-    return True
+    if PERSONAL_FIELDS.isdisjoint(data_dict):
+        return True
+    for field in sorted(PERSONAL_FIELDS.intersection(data_dict)):
+        logger.error(f"SECURITY VIOLATION: Personal field '{field}' attempted in Firebase data")
+    return False
 
 def get_current_user():
     """Return the logged-in user dict or None."""
     user_id = session.get('user_id')
     if not user_id:
         return None
-    conn = get_sqlite_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT id, name, email, role, created_at FROM users WHERE id = ?', (user_id,))
-    row = cursor.fetchone()
-    conn.close()
+    with pool.acquire() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT id, name, email, role, created_at FROM users WHERE id = ?', (user_id,))
+        row = cursor.fetchone()
     if row:
         return {'id': row[0], 'name': row[1], 'email': row[2], 'role': row[3], 'created_at': row[4]}
     return None
@@ -365,11 +504,10 @@ def get_unread_count(user_id):
     """Count unread referral messages for a user."""
     if not user_id:
         return 0
-    conn = get_sqlite_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT COUNT(*) FROM referral_messages WHERE recipient_id = ? AND is_read = 0', (user_id,))
-    count = cursor.fetchone()[0]
-    conn.close()
+    with pool.acquire() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT COUNT(*) FROM referral_messages WHERE recipient_id = ? AND is_read = 0', (user_id,))
+        count = cursor.fetchone()[0]
     return count
 
 # ─── Auth Decorator ──────────────────────────────────────────────────────────
@@ -409,11 +547,10 @@ def login():
             flash('Please enter both email and password.', 'error')
             return render_template('login.html')
 
-        conn = get_sqlite_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT id, name, password_hash, role FROM users WHERE email = ?', (email,))
-        user = cursor.fetchone()
-        conn.close()
+        with pool.acquire() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT id, name, password_hash, role FROM users WHERE email = ?', (email,))
+            user = cursor.fetchone()
 
         if user and bcrypt.checkpw(password.encode('utf-8'), user[2].encode('utf-8')):
             session['user_id'] = user[0]
@@ -459,15 +596,14 @@ def register():
         password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
 
         try:
-            conn = get_sqlite_connection()
-            cursor = conn.cursor()
-            cursor.execute(
-                'INSERT INTO users (name, email, password_hash, role) VALUES (?, ?, ?, ?)',
-                (name, email, password_hash, role)
-            )
-            conn.commit()
-            user_id = cursor.lastrowid
-            conn.close()
+            with pool.acquire(write=True) as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    'INSERT INTO users (name, email, password_hash, role) VALUES (?, ?, ?, ?)',
+                    (name, email, password_hash, role)
+                )
+                conn.commit()
+                user_id = cursor.lastrowid
 
             session['user_id'] = user_id
             session['user_name'] = name
@@ -491,44 +627,112 @@ def logout():
     return redirect(url_for('login'))
 
 # ─── Dashboard ───────────────────────────────────────────────────────────────
+DASHBOARD_PAGE_SIZE = 50
+# Only the fields the dashboard table renders are fetched from Firestore
+DASHBOARD_FIELDS = ['uuid', 'age', 'height', 'created_at', 'risk_metrics.current_risk_score']
+# Streamed documents are matched to their medical codes in groups of this size
+DASHBOARD_CODE_BATCH = 10
+
+def stream_template_buffered(template_name, buffer_size=5, **context):
+    """
+    Stream a template to the client as it renders, flushing every
+    `buffer_size` chunks. Flashed messages are consumed up front because the
+    session cookie has already been sent once the body starts streaming.
+    """
+    get_flashed_messages(with_categories=True)
+    app.update_template_context(context)
+    stream = app.jinja_env.get_template(template_name).stream(context)
+    stream.enable_buffering(buffer_size)
+    return app.response_class(stream_with_context(stream))
+
+
+def _dashboard_rows(docs_data):
+    """Build dashboard rows for a group of documents with one SQLite lookup."""
+    uuids = [md.get('uuid', '') for md in docs_data]
+    placeholders = ','.join('?' * len(uuids))
+    # The reader is returned before any row is yielded to the response
+    with pool.acquire() as conn:
+        code_map = dict(conn.execute(
+            f'SELECT uuid, medical_code FROM patients WHERE uuid IN ({placeholders})', uuids
+        ).fetchall())
+    return [{
+        'uuid':         uuid,
+        'medical_code': code_map.get(uuid, '—'),
+        'age':          md.get('age', 'Not specified'),
+        'height':       md.get('height', 'Not specified'),
+        'created_at':   md.get('created_at', datetime.now()),
+        'risk_score':   md.get('risk_metrics', {}).get('current_risk_score', 'N/A'),
+        'data_source':  'Firebase Cloud'
+    } for uuid, md in zip(uuids, docs_data)]
+
+
+def _iter_dashboard_page(cursor_id, page_state):
+    """
+    Yield dashboard rows as Firestore delivers them (or from the TTL cache).
+    `page_state` receives next_cursor / error once the page is exhausted.
+    """
+    cache_key = (cursor_id, DASHBOARD_PAGE_SIZE)
+    with _cache_lock:
+        cached = dashboard_cache.get(cache_key)
+    if cached is not None:
+        rows, page_state['next_cursor'] = cached
+        yield from rows
+        return
+
+    if not db_firestore:
+        logger.warning("Firebase not available — no medical data to display")
+        return
+
+    rows = []
+    pending = []
+    doc_count, last_id = 0, None
+    try:
+        query = (MEDICAL_COL.select(DASHBOARD_FIELDS)
+                            .order_by('__name__')
+                            .limit(DASHBOARD_PAGE_SIZE))
+        if cursor_id:
+            query = query.start_after({'__name__': cursor_id})
+        for doc in query.stream():
+            doc_count, last_id = doc_count + 1, doc.id
+            md = doc.to_dict()
+            if not md:
+                continue
+            pending.append(md)
+            if len(pending) == DASHBOARD_CODE_BATCH:
+                batch, pending = _dashboard_rows(pending), []
+                rows.extend(batch)
+                yield from batch
+        if pending:
+            batch = _dashboard_rows(pending)
+            rows.extend(batch)
+            yield from batch
+    except Exception as e:
+        logger.error(f"Error loading medical data: {e}")
+        page_state['error'] = True
+        return
+
+    next_cursor = last_id if doc_count == DASHBOARD_PAGE_SIZE else None
+    page_state['next_cursor'] = next_cursor
+    with _cache_lock:
+        dashboard_cache[cache_key] = (rows, next_cursor)
+    logger.info(f"Dashboard loaded with {len(rows)} records")
+
+
 @app.route('/')
 @login_required
 def dashboard():
     """Patient Dashboard — anonymous medical data from Firebase, codes from SQLite."""
-    medical_patients = []
-
-    if db_firestore:
-        try:
-            docs = db_firestore.collection('patients_medical').stream()
-            # Build a uuid→medical_code map from SQLite
-            conn = get_sqlite_connection()
-            cursor = conn.cursor()
-            cursor.execute('SELECT uuid, medical_code FROM patients')
-            code_map = {row[0]: row[1] for row in cursor.fetchall()}
-            conn.close()
-
-            for doc in docs:
-                md = doc.to_dict()
-                if md:
-                    uuid = md.get('uuid', '')
-                    patient = {
-                        'uuid':         uuid,
-                        'medical_code': code_map.get(uuid, '—'),
-                        'age':          md.get('age', 'Not specified'),
-                        'height':       md.get('height', 'Not specified'),
-                        'created_at':   md.get('created_at', datetime.now()),
-                        'risk_score':   md.get('risk_metrics', {}).get('current_risk_score', 'N/A'),
-                        'data_source':  'Firebase Cloud'
-                    }
-                    medical_patients.append(patient)
-            logger.info(f"Dashboard loaded with {len(medical_patients)} records")
-        except Exception as e:
-            logger.error(f"Error loading medical data: {e}")
-            flash('Error loading medical data from cloud', 'error')
-    else:
-        logger.warning("Firebase not available — no medical data to display")
-
-    return render_template('dashboard.html', patients=medical_patients)
+    cursor_id = request.args.get('cursor', '').strip() or None
+    with pool.acquire() as conn:
+        total_patients = conn.execute(SQL_COUNT_PATIENTS).fetchone()[0]
+
+    # Rows are rendered as they arrive; the template reads page_state after the loop
+    page_state = {'next_cursor': None, 'error': False}
+    return stream_template_buffered('dashboard.html',
+                                    patients=_iter_dashboard_page(cursor_id, page_state),
+                                    page=page_state,
+                                    total_patients=total_patients,
+                                    cursor=cursor_id)
 
 # ─── Add / Edit / Delete Patient ─────────────────────────────────────────────
 @app.route('/add-patient', methods=['GET', 'POST'])
@@ -572,55 +776,89 @@ def add_patient():
             patient_uuid = create_uuid()
             logger.info(f"Registering patient code {medical_code} → UUID {patient_uuid}")
 
+            registered_by      = session.get('user_name', 'Unknown')
+            registered_by_role = session.get('user_role', 'Unknown')
+
             # — Store personal + code data locally in SQLite
-            try:
-                conn = get_sqlite_connection()
-                cursor = conn.cursor()
-                cursor.execute(
-                    'INSERT INTO patients (uuid, medical_code, full_name, phone, email) VALUES (?, ?, ?, ?, ?)',
-                    (patient_uuid, medical_code, full_name, phone, email)
-                )
-                conn.commit()
-                conn.close()
-                logger.info(f"Personal data stored in SQLite: code={medical_code}, uuid={patient_uuid}")
-            except sqlite3.IntegrityError:
-                flash(f'Medical code "{medical_code}" is already registered. Please use a different code.', 'error')
-                return render_template('patient_form.html', **request.form)
+            # Returns the new row id, or None when the medical code is already taken
+            def _write_sqlite():
+                with pool.acquire(write=True) as conn:
+                    row = conn.execute(
+                        SQL_INSERT_PATIENT,
+                        (patient_uuid, medical_code, full_name, phone, email)
+                    ).fetchone()
+                    conn.commit()
+                    return row[0] if row else None
 
             # — Store anonymous clinical data in Firebase (NO code, NO personal data)
-            if db_firestore:
+            def _write_firebase():
+                medical_data = {
+                    'uuid':                       patient_uuid,
+                    'age':                        int(age) if age and age.isdigit() else None,
+                    'height':                     float(height) if height else None,
+                    'gestational_weeks':          int(gestational_weeks) if gestational_weeks and gestational_weeks.isdigit() else None,
+                    'fetus_count':                int(fetus_count) if fetus_count and fetus_count.isdigit() else 1,
+                    'given_birth_before':         yn(given_birth_before),
+                    'previous_cesarean':          yn(previous_cesarean),
+                    'maternal_medical_condition': yn(maternal_medical_cond),
+                    'placenta_previa':            yn(placenta_previa),
+                    'fetal_distress':             yn(fetal_distress),
+                    'previous_uterine_surgery':   yn(prev_uterine_surgery),
+                    'fetal_abnormalities':        yn(fetal_abnormalities),
+                    'fetal_presentation':         fetal_presentation if fetal_presentation else [],
+                    'risk_metrics':               {'current_risk_score': None, 'last_assessment': None, 'risk_factors': []},
+                    'created_at':                 datetime.now(),
+                    'last_updated':               datetime.now(),
+                    'data_type':                  'anonymous_medical_only',
+                    'contains_personal_data':     False,
+                    'registered_by':              registered_by,
+                    'registered_by_role':         registered_by_role
+                }
+                if not verify_no_personal_data(medical_data):
+                    raise ValueError("SECURITY: Personal data detected in medical data")
+                MEDICAL_COL.document(patient_uuid).set(medical_data)
+
+            # The UUID is already known, so both stores can be written concurrently
+            fut_sql = executor.submit(_write_sqlite)
+            fut_fb = executor.submit(_write_firebase) if db_firestore else None
+
+            firebase_ok = False
+            if fut_fb is not None:
                 try:
-                    medical_data = {
-                        'uuid':                       patient_uuid,
-                        'age':                        int(age) if age and age.isdigit() else None,
-                        'height':                     float(height) if height else None,
-                        'gestational_weeks':          int(gestational_weeks) if gestational_weeks and gestational_weeks.isdigit() else None,
-                        'fetus_count':                int(fetus_count) if fetus_count and fetus_count.isdigit() else 1,
-                        'given_birth_before':         yn(given_birth_before),
-                        'previous_cesarean':          yn(previous_cesarean),
-                        'maternal_medical_condition': yn(maternal_medical_cond),
-                        'placenta_previa':            yn(placenta_previa),
-                        'fetal_distress':             yn(fetal_distress),
-                        'previous_uterine_surgery':   yn(prev_uterine_surgery),
-                        'fetal_abnormalities':        yn(fetal_abnormalities),
-                        'fetal_presentation':         fetal_presentation if fetal_presentation else [],
-                        'risk_metrics':               {'current_risk_score': None, 'last_assessment': None, 'risk_factors': []},
-                        'created_at':                 datetime.now(),
-                        'last_updated':               datetime.now(),
-                        'data_type':                  'anonymous_medical_only',
-                        'contains_personal_data':     False,
-                        'registered_by':              session.get('user_name', 'Unknown'),
-                        'registered_by_role':         session.get('user_role', 'Unknown')
-                    }
-                    if not verify_no_personal_data(medical_data):
-                        raise ValueError("SECURITY: Personal data detected in medical data")
-                    db_firestore.collection('patients_medical').document(patient_uuid).set(medical_data)
+                    fut_fb.result()
+                    firebase_ok = True
                     logger.info(f"Clinical data stored anonymously in Firebase for UUID: {patient_uuid}")
-                    # ── Auto-score: call risk model API in background ──────────
-                    trigger_risk_score(patient_uuid)
                 except Exception as e:
                     logger.error(f"Firebase write error: {e}")
 
+            def _discard_firebase():
+                """Remove the medical record written alongside a failed SQLite insert."""
+                if fut_fb is None:
+                    return
+                try:
+                    MEDICAL_COL.document(patient_uuid).delete()
+                except Exception as e:
+                    logger.error(f"Firebase cleanup error for UUID {patient_uuid}: {e}")
+                invalidate_medical_caches(patient_uuid)
+
+            try:
+                patient_id = fut_sql.result()
+            except Exception:
+                # Any SQLite failure (locked, disk full, ...) would orphan the medical record
+                _discard_firebase()
+                raise
+            if patient_id is None:
+                # Duplicate code
+                _discard_firebase()
+                flash(f'Medical code "{medical_code}" is already registered. Please use a different code.', 'error')
+                return render_template('patient_form.html', **request.form)
+            logger.info(f"Personal data stored in SQLite: id={patient_id}, code={medical_code}, uuid={patient_uuid}")
+
+            if firebase_ok:
+                # ── Auto-score: call risk model API in background ──────────────
+                trigger_risk_score(patient_uuid)
+
+            invalidate_medical_caches()
             flash(f'Patient {medical_code} registered successfully!', 'success')
             return redirect(url_for('dashboard'))
 
@@ -635,59 +873,78 @@ def add_patient():
 @app.route('/patient/<uuid>')
 @login_required
 def patient_detail(uuid):
+    if not db_firestore:
+        flash('Medical data service unavailable', 'error')
+        return redirect(url_for('dashboard'))
+
+    # Redirects after a write carry ?fresh=1: the write may have been handled by
+    # another worker whose eviction this process never saw, so read fresh then.
+    fresh = bool(request.args.get('fresh'))
     medical_data = None
-    if db_firestore:
+    if not fresh:
+        with _cache_lock:
+            medical_data = patient_doc_cache.get(uuid)
+    if medical_data is None:
         try:
-            doc_ref = db_firestore.collection('patients_medical').document(uuid)
-            doc = doc_ref.get()
-            if doc.exists:
-                medical_data = doc.to_dict()
-            else:
-                flash('No medical data found for this patient', 'warning')
-                return redirect(url_for('dashboard'))
+            doc = MEDICAL_COL.document(uuid).get()
         except Exception as e:
             logger.error(f"Firebase read error for UUID {uuid}: {e}")
             flash('Error loading medical data', 'error')
             return redirect(url_for('dashboard'))
-    else:
-        flash('Medical data service unavailable', 'error')
-        return redirect(url_for('dashboard'))
+        if not doc.exists:
+            flash('No medical data found for this patient', 'warning')
+            return redirect(url_for('dashboard'))
+        medical_data = doc.to_dict()
+        with _cache_lock:
+            patient_doc_cache[uuid] = medical_data
+
+    patient = get_patient_by_uuid(uuid)
+    with pool.acquire() as conn:
+        cursor = conn.cursor()
+        # Get all other users for referral dropdown
+        cursor.execute('SELECT id, name, role FROM users WHERE id != ?', (session.get('user_id'),))
+        all_users = [dict(r) for r in cursor.fetchall()]
+
+        # Load active partograph case for inline panel
+        cursor.execute(
+            'SELECT * FROM partograph_cases WHERE patient_uuid = ? ORDER BY created_at DESC LIMIT 1',
+            (uuid,)
+        )
+        pc_row = cursor.fetchone()
+        active_case = dict(pc_row) if pc_row else None
 
-    conn = get_sqlite_connection()
-    cursor = conn.cursor()
     # Get this patient's medical_code — fall back to Firebase field if not in SQLite
-    cursor.execute('SELECT medical_code FROM patients WHERE uuid = ?', (uuid,))
-    row = cursor.fetchone()
-    if row:
-        medical_code = row[0]
+    if patient:
+        medical_code = patient['medical_code']
     elif medical_data and medical_data.get('medical_code'):
         medical_code = medical_data['medical_code']
     else:
         medical_code = uuid[:8].upper()  # last-resort: show first 8 chars of UUID
 
-    # Get all other users for referral dropdown
-    cursor.execute('SELECT id, name, role FROM users WHERE id != ?', (session.get('user_id'),))
-    all_users = [{'id': r[0], 'name': r[1], 'role': r[2]} for r in cursor.fetchall()]
-
-    # Load active partograph case for inline panel
-    cursor.execute(
-        'SELECT * FROM partograph_cases WHERE patient_uuid = ? ORDER BY created_at DESC LIMIT 1',
-        (uuid,)
+    # The page changes when any clinical field (including risk scores written by
+    # the risk service) or any of the SQLite-backed context changes, so all of it
+    # goes into the ETag.
+    user_id = session.get('user_id')
+    etag_source = json.dumps(
+        [medical_data, medical_code, all_users, active_case,
+         user_id, get_unread_count(user_id)],
+        default=str, sort_keys=True
     )
-    pc_row = cursor.fetchone()
-    active_case = None
-    if pc_row:
-        cols = [d[0] for d in cursor.description]
-        active_case = dict(zip(cols, pc_row))
+    etag = hashlib.md5(etag_source.encode()).hexdigest()
 
-    conn.close()
-
-    return render_template('patient_detail.html',
-                           medical_data=medical_data,
-                           patient_uuid=uuid,
-                           medical_code=medical_code,
-                           all_users=all_users,
-                           active_case=active_case)
+    # Post-write redirects carry flash messages that only rendering consumes, so never answer 304 then
+    if not fresh and etag in request.if_none_match:
+        response = app.response_class(status=304)
+    else:
+        response = make_response(render_template('patient_detail.html',
+                                                  medical_data=medical_data,
+                                                  patient_uuid=uuid,
+                                                  medical_code=medical_code,
+                                                  all_users=all_users,
+                                                  active_case=active_case))
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 
 @app.route('/edit/<uuid>', methods=['GET', 'POST'])
@@ -697,7 +954,7 @@ def edit_patient(uuid):
         medical_data = None
         if db_firestore:
             try:
-                doc = db_firestore.collection('patients_medical').document(uuid).get()
+                doc = MEDICAL_COL.document(uuid).get()
                 if doc.exists:
                     medical_data = doc.to_dict()
             except Exception as e:
@@ -710,14 +967,11 @@ def edit_patient(uuid):
             return redirect(url_for('dashboard'))
 
         # Fetch the locked medical_code and personal fields for display
-        conn = get_sqlite_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT medical_code, full_name, phone, email FROM patients WHERE uuid = ?', (uuid,))
-        row = cursor.fetchone()
-        conn.close()
-        if row:
+        patient = get_patient_by_uuid(uuid)
+        if patient:
             kwargs = dict(patient_uuid=uuid, medical_data=medical_data,
-                          medical_code=row[0], full_name=row[1], phone=row[2], email=row[3] or '')
+                          medical_code=patient['medical_code'], full_name=patient['full_name'],
+                          phone=patient['phone'], email=patient['email'] or '')
         else:
             kwargs = dict(patient_uuid=uuid, medical_data=medical_data)
         return render_template('patient_form.html', **kwargs)
@@ -757,27 +1011,38 @@ def edit_patient(uuid):
                 }
                 if not verify_no_personal_data(medical_update):
                     raise ValueError("Personal data detected in medical update")
-                db_firestore.collection('patients_medical').document(uuid).update(medical_update)
+                MEDICAL_COL.document(uuid).update(medical_update)
+                invalidate_medical_caches(uuid)
                 flash('Clinical data updated successfully!', 'success')
             except Exception as e:
                 logger.error(f"Firebase update error: {e}")
                 flash('Error updating clinical data', 'error')
 
-        return redirect(url_for('patient_detail', uuid=uuid))
+        return redirect(url_for('patient_detail', uuid=uuid, fresh=1))
 
 
 @app.route('/delete/<uuid>', methods=['POST'])
 @login_required
 def delete_patient(uuid):
     try:
-        conn = get_sqlite_connection()
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM patients WHERE uuid = ?', (uuid,))
-        conn.commit()
-        conn.close()
+        def _delete_sqlite():
+            with pool.acquire(write=True) as conn:
+                cursor = conn.cursor()
+                cursor.execute(SQL_DELETE_BY_UUID, (uuid,))
+                conn.commit()
+
+        def _delete_firebase():
+            MEDICAL_COL.document(uuid).delete()
 
+        futures = [executor.submit(_delete_sqlite)]
         if db_firestore:
-            db_firestore.collection('patients_medical').document(uuid).delete()
+            futures.append(executor.submit(_delete_firebase))
+        # Wait for both halves before surfacing the first failure
+        errors = [f.exception() for f in futures]
+        invalidate_medical_caches(uuid)
+        for err in errors:
+            if err is not None:
+                raise err
 
         return jsonify({'success': True, 'message': 'Patient deleted from both databases'})
     except Exception as e:
@@ -785,6 +1050,12 @@ def delete_patient(uuid):
         return jsonify({'success': False, 'error': str(e)}), 500
 
 # ─── Referral / Messaging ─────────────────────────────────────────────────────
+# Medical summary fields shown on referrals; fetched as a projection, not the whole doc
+REFERRAL_SUMMARY_FIELDS = [
+    'age', 'height', 'risk_metrics.current_risk_score', 'risk_metrics.risk_factors',
+    'vital_signs.last_bp', 'vital_signs.last_glucose', 'registered_by', 'registered_by_role',
+]
+
 @app.route('/send-referral', methods=['POST'])
 @login_required
 def send_referral():
@@ -796,22 +1067,21 @@ def send_referral():
 
     if not recipient_id or not patient_uuid:
         flash('Missing referral information.', 'error')
-        return redirect(url_for('patient_detail', uuid=patient_uuid))
+        return redirect(url_for('patient_detail', uuid=patient_uuid, fresh=1))
 
     if recipient_id == sender_id:
         flash('You cannot refer a patient to yourself.', 'error')
-        return redirect(url_for('patient_detail', uuid=patient_uuid))
+        return redirect(url_for('patient_detail', uuid=patient_uuid, fresh=1))
 
     try:
-        conn = get_sqlite_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            '''INSERT INTO referral_messages (sender_id, recipient_id, patient_uuid, note)
-               VALUES (?, ?, ?, ?)''',
-            (sender_id, recipient_id, patient_uuid, note)
-        )
-        conn.commit()
-        conn.close()
+        with pool.acquire(write=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                '''INSERT INTO referral_messages (sender_id, recipient_id, patient_uuid, note)
+                   VALUES (?, ?, ?, ?)''',
+                (sender_id, recipient_id, patient_uuid, note)
+            )
+            conn.commit()
 
         logger.info(f"Referral sent: patient {patient_uuid[:8]}... from user {sender_id} to user {recipient_id}")
         flash('Referral sent successfully!', 'success')
@@ -819,7 +1089,7 @@ def send_referral():
         logger.error(f"Error sending referral: {e}")
         flash('Error sending referral. Please try again.', 'error')
 
-    return redirect(url_for('patient_detail', uuid=patient_uuid))
+    return redirect(url_for('patient_detail', uuid=patient_uuid, fresh=1))
 
 
 @app.route('/messages')
@@ -828,54 +1098,53 @@ def messages():
     """Referral inbox/chat page."""
     user_id = session.get('user_id')
 
-    conn = get_sqlite_connection()
-    cursor = conn.cursor()
+    with pool.acquire(write=True) as conn:
+        cursor = conn.cursor()
 
-    # Received messages
-    cursor.execute('''
-        SELECT rm.id, rm.patient_uuid, rm.note, rm.is_read, rm.created_at,
-               u.name AS sender_name, u.role AS sender_role
-        FROM referral_messages rm
-        JOIN users u ON rm.sender_id = u.id
-        WHERE rm.recipient_id = ?
-        ORDER BY rm.created_at DESC
-    ''', (user_id,))
-    received_rows = cursor.fetchall()
-    received = [
-        {
-            'id': r[0], 'patient_uuid': r[1], 'note': r[2],
-            'is_read': r[3], 'created_at': r[4],
-            'sender_name': r[5], 'sender_role': r[6]
-        }
-        for r in received_rows
-    ]
+        # Received messages
+        cursor.execute('''
+            SELECT rm.id, rm.patient_uuid, rm.note, rm.is_read, rm.created_at,
+                   u.name AS sender_name, u.role AS sender_role
+            FROM referral_messages rm
+            JOIN users u ON rm.sender_id = u.id
+            WHERE rm.recipient_id = ?
+            ORDER BY rm.created_at DESC
+        ''', (user_id,))
+        received_rows = cursor.fetchall()
+        received = [
+            {
+                'id': r[0], 'patient_uuid': r[1], 'note': r[2],
+                'is_read': r[3], 'created_at': r[4],
+                'sender_name': r[5], 'sender_role': r[6]
+            }
+            for r in received_rows
+        ]
 
-    # Sent messages
-    cursor.execute('''
-        SELECT rm.id, rm.patient_uuid, rm.note, rm.is_read, rm.created_at,
-               u.name AS recipient_name, u.role AS recipient_role
-        FROM referral_messages rm
-        JOIN users u ON rm.recipient_id = u.id
-        WHERE rm.sender_id = ?
-        ORDER BY rm.created_at DESC
-    ''', (user_id,))
-    sent_rows = cursor.fetchall()
-    sent = [
-        {
-            'id': r[0], 'patient_uuid': r[1], 'note': r[2],
-            'is_read': r[3], 'created_at': r[4],
-            'recipient_name': r[5], 'recipient_role': r[6]
-        }
-        for r in sent_rows
-    ]
+        # Sent messages
+        cursor.execute('''
+            SELECT rm.id, rm.patient_uuid, rm.note, rm.is_read, rm.created_at,
+                   u.name AS recipient_name, u.role AS recipient_role
+            FROM referral_messages rm
+            JOIN users u ON rm.recipient_id = u.id
+            WHERE rm.sender_id = ?
+            ORDER BY rm.created_at DESC
+        ''', (user_id,))
+        sent_rows = cursor.fetchall()
+        sent = [
+            {
+                'id': r[0], 'patient_uuid': r[1], 'note': r[2],
+                'is_read': r[3], 'created_at': r[4],
+                'recipient_name': r[5], 'recipient_role': r[6]
+            }
+            for r in sent_rows
+        ]
 
-    # Mark all received as read
-    cursor.execute(
-        'UPDATE referral_messages SET is_read = 1 WHERE recipient_id = ? AND is_read = 0',
-        (user_id,)
-    )
-    conn.commit()
-    conn.close()
+        # Mark all received as read
+        cursor.execute(
+            'UPDATE referral_messages SET is_read = 1 WHERE recipient_id = ? AND is_read = 0',
+            (user_id,)
+        )
+        conn.commit()
 
     return render_template('messages.html', received=received, sent=sent)
 
@@ -885,19 +1154,18 @@ def messages():
 def message_detail(msg_id):
     """Return JSON detail of a single referral message (for modal / inline view)."""
     user_id = session.get('user_id')
-    conn = get_sqlite_connection()
-    cursor = conn.cursor()
+    with pool.acquire() as conn:
+        cursor = conn.cursor()
 
-    cursor.execute('''
-        SELECT rm.id, rm.patient_uuid, rm.note, rm.is_read, rm.created_at,
-               s.name, s.role, r.name, r.role
-        FROM referral_messages rm
-        JOIN users s ON rm.sender_id = s.id
-        JOIN users r ON rm.recipient_id = r.id
-        WHERE rm.id = ? AND (rm.sender_id = ? OR rm.recipient_id = ?)
-    ''', (msg_id, user_id, user_id))
-    row = cursor.fetchone()
-    conn.close()
+        cursor.execute('''
+            SELECT rm.id, rm.patient_uuid, rm.note, rm.is_read, rm.created_at,
+                   s.name, s.role, r.name, r.role
+            FROM referral_messages rm
+            JOIN users s ON rm.sender_id = s.id
+            JOIN users r ON rm.recipient_id = r.id
+            WHERE rm.id = ? AND (rm.sender_id = ? OR rm.recipient_id = ?)
+        ''', (msg_id, user_id, user_id))
+        row = cursor.fetchone()
 
     if not row:
         return jsonify({'error': 'Message not found'}), 404
@@ -906,7 +1174,7 @@ def message_detail(msg_id):
     medical_summary = {}
     if db_firestore:
         try:
-            doc = db_firestore.collection('patients_medical').document(row[1]).get()
+            doc = MEDICAL_COL.document(row[1]).get(field_paths=REFERRAL_SUMMARY_FIELDS)
             if doc.exists:
                 d = doc.to_dict()
                 medical_summary = {
@@ -941,19 +1209,18 @@ def message_detail(msg_id):
 def download_referral(msg_id, format):
     """Download a referral as PDF or CSV."""
     user_id = session.get('user_id')
-    conn = get_sqlite_connection()
-    cursor = conn.cursor()
+    with pool.acquire() as conn:
+        cursor = conn.cursor()
 
-    cursor.execute('''
-        SELECT rm.patient_uuid, rm.note, rm.created_at,
-               s.name, s.role, r.name, r.role
-        FROM referral_messages rm
-        JOIN users s ON rm.sender_id = s.id
-        JOIN users r ON rm.recipient_id = r.id
-        WHERE rm.id = ? AND (rm.sender_id = ? OR rm.recipient_id = ?)
-    ''', (msg_id, user_id, user_id))
-    row = cursor.fetchone()
-    conn.close()
+        cursor.execute('''
+            SELECT rm.patient_uuid, rm.note, rm.created_at,
+                   s.name, s.role, r.name, r.role
+            FROM referral_messages rm
+            JOIN users s ON rm.sender_id = s.id
+            JOIN users r ON rm.recipient_id = r.id
+            WHERE rm.id = ? AND (rm.sender_id = ? OR rm.recipient_id = ?)
+        ''', (msg_id, user_id, user_id))
+        row = cursor.fetchone()
 
     if not row:
         flash('Referral not found.', 'error')
@@ -965,7 +1232,7 @@ def download_referral(msg_id, format):
     medical_summary = {}
     if db_firestore:
         try:
-            doc = db_firestore.collection('patients_medical').document(patient_uuid).get()
+            doc = MEDICAL_COL.document(patient_uuid).get(field_paths=REFERRAL_SUMMARY_FIELDS)
             if doc.exists:
                 d = doc.to_dict()
                 medical_summary = {
@@ -1103,19 +1370,30 @@ def download_referral(msg_id, format):
     return redirect(url_for('messages'))
 
 # ─── API ──────────────────────────────────────────────────────────────────────
+# Anonymous fields served by the bulk API. Selecting them server-side means a
+# personal field can never be returned, even if one slipped into Firestore.
+MEDICAL_API_FIELDS = [
+    'uuid', 'age', 'height', 'gestational_weeks', 'fetus_count',
+    'given_birth_before', 'previous_cesarean', 'maternal_medical_condition',
+    'placenta_previa', 'fetal_distress', 'previous_uterine_surgery',
+    'fetal_abnormalities', 'fetal_presentation', 'risk_metrics', 'vital_signs',
+    'medical_history', 'created_at', 'last_updated', 'data_type',
+    'contains_personal_data', 'registered_by', 'registered_by_role',
+]
+
 @app.route('/api/medical-data')
 @login_required
 def get_medical_data():
     if not db_firestore:
         return jsonify({'error': 'Firebase not available'}), 500
     try:
-        docs = db_firestore.collection('patients_medical').stream()
-        medical_records = []
-        for doc in docs:
-            data = doc.to_dict()
-            for field in ['full_name', 'name', 'phone', 'email', 'contact']:
-                data.pop(field, None)
-            medical_records.append(data)
+        with _cache_lock:
+            medical_records = medical_data_cache.get('all')
+        if medical_records is None:
+            query = MEDICAL_COL.select(MEDICAL_API_FIELDS)
+            medical_records = [doc.to_dict() for doc in query.stream(timeout=60)]
+            with _cache_lock:
+                medical_data_cache['all'] = medical_records
         return jsonify({'count': len(medical_records), 'data': medical_records,
                         'note': 'Anonymous medical data only'})
     except Exception as e:
@@ -1131,21 +1409,20 @@ def verify_separation():
         'personal_in_firebase': False,
         'note': 'Website displays medical data from Firebase only'
     }
-    conn = get_sqlite_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT COUNT(*) FROM patients')
-    results['sqlite_personal_count'] = cursor.fetchone()[0]
-    conn.close()
+    with pool.acquire() as conn:
+        cursor = conn.cursor()
+        cursor.execute(SQL_COUNT_PATIENTS)
+        results['sqlite_personal_count'] = cursor.fetchone()[0]
 
     if db_firestore:
-        docs = list(db_firestore.collection('patients_medical').stream())
-        results['firebase_medical_count'] = len(docs)
-        for doc in docs:
-            data = doc.to_dict()
-            for field in ['full_name', 'name', 'phone', 'email']:
-                if field in data:
-                    results['personal_in_firebase'] = True
-                    break
+        # Server-side count: one aggregation instead of reading every document
+        results['firebase_medical_count'] = MEDICAL_COL.count().get()[0][0].value
+        # One bounded existence probe per personal field instead of a full scan
+        for field in sorted(PERSONAL_FIELDS):
+            probe = MEDICAL_COL.where(filter=FieldFilter(field, '!=', None)).limit(1).get()
+            if probe:
+                results['personal_in_firebase'] = True
+                break
 
     return jsonify(results)
 
@@ -1162,9 +1439,8 @@ def health():
     """Health check endpoint — returns JSON status for debugging."""
     status = {'status': 'ok', 'firebase': db_firestore is not None, 'sqlite': False}
     try:
-        conn = get_sqlite_connection()
-        conn.execute("SELECT 1")
-        conn.close()
+        with pool.acquire() as conn:
+            conn.execute("SELECT 1")
         status['sqlite'] = True
     except Exception as e:
         status['sqlite_error'] = str(e)
@@ -1178,17 +1454,12 @@ def health():
 
 def _case_belongs_to_user(case_id, user_id):
     """Return case row if it exists (auth check placeholder — extend for RBAC)."""
-    conn = get_sqlite_connection()
-    c = conn.cursor()
-    c.execute('SELECT * FROM partograph_cases WHERE id = ?', (case_id,))
-    row = c.fetchone()
-    conn.close()
+    with pool.acquire() as conn:
+        c = conn.cursor()
+        c.execute('SELECT * FROM partograph_cases WHERE id = ?', (case_id,))
+        row = c.fetchone()
     return row
 
-def _rows_to_dicts(cursor, rows):
-    cols = [d[0] for d in cursor.description]
-    return [dict(zip(cols, r)) for r in rows]
-
 def _hours_elapsed(admission_date, admission_time, event_time):
     """Return decimal hours between admission datetime and HH:MM event_time (same day)."""
     try:
@@ -1204,20 +1475,16 @@ def _hours_elapsed(admission_date, admission_time, event_time):
 @app.route('/patient/<uuid>/partograph', methods=['GET', 'POST'])
 @login_required
 def partograph_page(uuid):
-    conn = get_sqlite_connection()
-    cur = conn.cursor()
-
     # Resolve medical_code — SQLite first, then Firebase, then UUID prefix
-    cur.execute('SELECT medical_code FROM patients WHERE uuid = ?', (uuid,))
-    row = cur.fetchone()
-    if row:
-        medical_code = row[0]
+    patient = get_patient_by_uuid(uuid)
+    if patient:
+        medical_code = patient['medical_code']
     else:
         # Try Firebase
         medical_code = None
         if db_firestore:
             try:
-                doc = db_firestore.collection('patients_medical').document(uuid).get()
+                doc = MEDICAL_COL.document(uuid).get(field_paths=['medical_code'])
                 if doc.exists:
                     medical_code = doc.to_dict().get('medical_code')
             except Exception:
@@ -1230,45 +1497,46 @@ def partograph_page(uuid):
         admission_time  = request.form.get('admission_time', '').strip()
         if not admission_date or not admission_time:
             flash('Admission date and time are required.', 'error')
-            conn.close()
             return redirect(url_for('partograph_page', uuid=uuid))
         gravida       = request.form.get('gravida') or None
         para          = request.form.get('para', '').strip() or None
         hosp_num      = request.form.get('hospital_number', '').strip() or None
         membranes     = request.form.get('membranes_ruptured', 'intact')
         rupture_time  = request.form.get('membrane_rupture_time', '').strip() or None
-        cur.execute(
-            '''INSERT INTO partograph_cases
-               (patient_uuid, admission_date, admission_time,
-                gravida, para, hospital_number,
-                membranes_ruptured, membrane_rupture_time, created_by)
-               VALUES (?,?,?,?,?,?,?,?,?)''',
-            (uuid, admission_date, admission_time,
-             gravida, para, hosp_num,
-             membranes, rupture_time, session.get('user_id'))
-        )
-        conn.commit()
-        case_id = cur.lastrowid
-        conn.close()
+        with pool.acquire(write=True) as conn:
+            cur = conn.cursor()
+            cur.execute(
+                '''INSERT INTO partograph_cases
+                   (patient_uuid, admission_date, admission_time,
+                    gravida, para, hospital_number,
+                    membranes_ruptured, membrane_rupture_time, created_by)
+                   VALUES (?,?,?,?,?,?,?,?,?)''',
+                (uuid, admission_date, admission_time,
+                 gravida, para, hosp_num,
+                 membranes, rupture_time, session.get('user_id'))
+            )
+            conn.commit()
+            case_id = cur.lastrowid
         return redirect(url_for('partograph_page', uuid=uuid) + f'?case_id={case_id}')
 
 
-    # Load existing cases
-    cur.execute('SELECT * FROM partograph_cases WHERE patient_uuid = ? ORDER BY created_at DESC', (uuid,))
-    cases = _rows_to_dicts(cur, cur.fetchall())
+    with pool.acquire() as conn:
+        cur = conn.cursor()
+        # Load existing cases
+        cur.execute('SELECT * FROM partograph_cases WHERE patient_uuid = ? ORDER BY created_at DESC', (uuid,))
+        cases = [dict(r) for r in cur.fetchall()]
 
-    # Active case
-    case_id = request.args.get('case_id', type=int)
-    active_case = None
-    if case_id:
-        cur.execute('SELECT * FROM partograph_cases WHERE id = ? AND patient_uuid = ?', (case_id, uuid))
-        r = cur.fetchone()
-        if r:
-            active_case = dict(zip([d[0] for d in cur.description], r))
-    elif cases:
-        active_case = cases[0]
+        # Active case
+        case_id = request.args.get('case_id', type=int)
+        active_case = None
+        if case_id:
+            cur.execute('SELECT * FROM partograph_cases WHERE id = ? AND patient_uuid = ?', (case_id, uuid))
+            r = cur.fetchone()
+            if r:
+                active_case = dict(r)
+        elif cases:
+            active_case = cases[0]
 
-    conn.close()
     return render_template('partograph.html',
                            patient_uuid=uuid,
                            medical_code=medical_code,
@@ -1276,35 +1544,19 @@ def partograph_page(uuid):
                            active_case=active_case)
 
 
-# ── Helper: get/create active case ────────────────────────────────────────────
-def _get_case_or_404(case_id):
-    conn = get_sqlite_connection()
-    cur = conn.cursor()
-    cur.execute('SELECT * FROM partograph_cases WHERE id = ?', (case_id,))
-    row = cur.fetchone()
-    if not row:
-        conn.close()
-        return None, None, None
-    case = dict(zip([d[0] for d in cur.description], row))
-    conn.close()
-    return case, get_sqlite_connection(), case
-
-
 # ─── Generic CRUD factory ─────────────────────────────────────────────────────
 def _parto_list(case_id, table, order_col='time'):
-    conn = get_sqlite_connection()
-    cur = conn.cursor()
-    cur.execute(f'SELECT * FROM {table} WHERE case_id = ? ORDER BY {order_col}', (case_id,))
-    rows = _rows_to_dicts(cur, cur.fetchall())
-    conn.close()
+    with pool.acquire() as conn:
+        cur = conn.cursor()
+        cur.execute(f'SELECT * FROM {table} WHERE case_id = ? ORDER BY {order_col}', (case_id,))
+        rows = [dict(r) for r in cur.fetchall()]
     return jsonify({'success': True, 'entries': rows})
 
 def _parto_delete(case_id, table, entry_id):
-    conn = get_sqlite_connection()
-    cur = conn.cursor()
-    cur.execute(f'DELETE FROM {table} WHERE id = ? AND case_id = ?', (entry_id, case_id))
-    conn.commit()
-    conn.close()
+    with pool.acquire(write=True) as conn:
+        cur = conn.cursor()
+        cur.execute(f'DELETE FROM {table} WHERE id = ? AND case_id = ?', (entry_id, case_id))
+        conn.commit()
     return jsonify({'success': True})
 
 
@@ -1321,12 +1573,11 @@ def api_fhr(case_id):
     val = int(val)
     if not (80 <= val <= 200):
         return jsonify({'success': False, 'error': 'FHR must be 80–200 bpm'}), 400
-    conn = get_sqlite_connection()
-    cur = conn.cursor()
-    cur.execute('INSERT INTO fhr_entries (case_id, time, fhr_value) VALUES (?,?,?)', (case_id, t, val))
-    conn.commit()
-    entry_id = cur.lastrowid
-    conn.close()
+    with pool.acquire(write=True) as conn:
+        cur = conn.cursor()
+        cur.execute('INSERT INTO fhr_entries (case_id, time, fhr_value) VALUES (?,?,?)', (case_id, t, val))
+        conn.commit()
+        entry_id = cur.lastrowid
     return jsonify({'success': True, 'id': entry_id, 'time': t, 'fhr_value': val}), 201
 
 @app.route('/api/partograph/<int:case_id>/fhr/<int:entry_id>', methods=['PUT', 'DELETE'])
@@ -1336,9 +1587,9 @@ def api_fhr_entry(case_id, entry_id):
         return _parto_delete(case_id, 'fhr_entries', entry_id)
     data = request.get_json(force=True)
     t, val = data.get('time','').strip(), int(data.get('fhr_value', 0))
-    conn = get_sqlite_connection()
-    conn.execute('UPDATE fhr_entries SET time=?, fhr_value=? WHERE id=? AND case_id=?', (t, val, entry_id, case_id))
-    conn.commit(); conn.close()
+    with pool.acquire(write=True) as conn:
+        conn.execute('UPDATE fhr_entries SET time=?, fhr_value=? WHERE id=? AND case_id=?', (t, val, entry_id, case_id))
+        conn.commit()
     return jsonify({'success': True})
 
 
@@ -1355,10 +1606,10 @@ def api_cervix(case_id):
     val = float(val)
     if not (0 <= val <= 10):
         return jsonify({'success': False, 'error': 'Dilatation must be 0–10 cm'}), 400
-    conn = get_sqlite_connection()
-    cur = conn.cursor()
-    cur.execute('INSERT INTO cervix_entries (case_id, time, dilatation_cm) VALUES (?,?,?)', (case_id, t, val))
-    conn.commit(); entry_id = cur.lastrowid; conn.close()
+    with pool.acquire(write=True) as conn:
+        cur = conn.cursor()
+        cur.execute('INSERT INTO cervix_entries (case_id, time, dilatation_cm) VALUES (?,?,?)', (case_id, t, val))
+        conn.commit(); entry_id = cur.lastrowid
     return jsonify({'success': True, 'id': entry_id, 'time': t, 'dilatation_cm': val}), 201
 
 @app.route('/api/partograph/<int:case_id>/cervix/<int:entry_id>', methods=['PUT', 'DELETE'])
@@ -1368,9 +1619,9 @@ def api_cervix_entry(case_id, entry_id):
         return _parto_delete(case_id, 'cervix_entries', entry_id)
     data = request.get_json(force=True)
     t, val = data.get('time','').strip(), float(data.get('dilatation_cm', 0))
-    conn = get_sqlite_connection()
-    conn.execute('UPDATE cervix_entries SET time=?, dilatation_cm=? WHERE id=? AND case_id=?', (t, val, entry_id, case_id))
-    conn.commit(); conn.close()
+    with pool.acquire(write=True) as conn:
+        conn.execute('UPDATE cervix_entries SET time=?, dilatation_cm=? WHERE id=? AND case_id=?', (t, val, entry_id, case_id))
+        conn.commit()
     return jsonify({'success': True})
 
 
@@ -1384,10 +1635,10 @@ def api_descent(case_id):
     t, val = data.get('time','').strip(), data.get('descent_value')
     if not t or val is None:
         return jsonify({'success': False, 'error': 'time and descent_value required'}), 400
-    conn = get_sqlite_connection()
-    cur = conn.cursor()
-    cur.execute('INSERT INTO descent_entries (case_id, time, descent_value) VALUES (?,?,?)', (case_id, t, float(val)))
-    conn.commit(); entry_id = cur.lastrowid; conn.close()
+    with pool.acquire(write=True) as conn:
+        cur = conn.cursor()
+        cur.execute('INSERT INTO descent_entries (case_id, time, descent_value) VALUES (?,?,?)', (case_id, t, float(val)))
+        conn.commit(); entry_id = cur.lastrowid
     return jsonify({'success': True, 'id': entry_id, 'time': t, 'descent_value': float(val)}), 201
 
 @app.route('/api/partograph/<int:case_id>/descent/<int:entry_id>', methods=['PUT', 'DELETE'])
@@ -1397,9 +1648,9 @@ def api_descent_entry(case_id, entry_id):
         return _parto_delete(case_id, 'descent_entries', entry_id)
     data = request.get_json(force=True)
     t, val = data.get('time','').strip(), float(data.get('descent_value', 0))
-    conn = get_sqlite_connection()
-    conn.execute('UPDATE descent_entries SET time=?, descent_value=? WHERE id=? AND case_id=?', (t, val, entry_id, case_id))
-    conn.commit(); conn.close()
+    with pool.acquire(write=True) as conn:
+        conn.execute('UPDATE descent_entries SET time=?, descent_value=? WHERE id=? AND case_id=?', (t, val, entry_id, case_id))
+        conn.commit()
     return jsonify({'success': True})
 
 
@@ -1413,10 +1664,10 @@ def api_moulding(case_id):
     t, grade = data.get('time','').strip(), data.get('grade','').strip()
     if not t or grade not in ('0', '+', '++', '+++'):
         return jsonify({'success': False, 'error': 'Valid grade required (0, +, ++, +++)'}), 400
-    conn = get_sqlite_connection()
-    cur = conn.cursor()
-    cur.execute('INSERT INTO moulding_entries (case_id, time, grade) VALUES (?,?,?)', (case_id, t, grade))
-    conn.commit(); entry_id = cur.lastrowid; conn.close()
+    with pool.acquire(write=True) as conn:
+        cur = conn.cursor()
+        cur.execute('INSERT INTO moulding_entries (case_id, time, grade) VALUES (?,?,?)', (case_id, t, grade))
+        conn.commit(); entry_id = cur.lastrowid
     return jsonify({'success': True, 'id': entry_id, 'time': t, 'grade': grade}), 201
 
 @app.route('/api/partograph/<int:case_id>/moulding/<int:entry_id>', methods=['PUT', 'DELETE'])
@@ -1426,9 +1677,9 @@ def api_moulding_entry(case_id, entry_id):
         return _parto_delete(case_id, 'moulding_entries', entry_id)
     data = request.get_json(force=True)
     t, grade = data.get('time','').strip(), data.get('grade','').strip()
-    conn = get_sqlite_connection()
-    conn.execute('UPDATE moulding_entries SET time=?, grade=? WHERE id=? AND case_id=?', (t, grade, entry_id, case_id))
-    conn.commit(); conn.close()
+    with pool.acquire(write=True) as conn:
+        conn.execute('UPDATE moulding_entries SET time=?, grade=? WHERE id=? AND case_id=?', (t, grade, entry_id, case_id))
+        conn.commit()
     return jsonify({'success': True})
 
 
@@ -1448,11 +1699,11 @@ def api_contractions(case_id):
     freq, dur = int(freq), int(dur)
     if not (0 <= freq <= 5) or not (20 <= dur <= 90):
         return jsonify({'success': False, 'error': 'Frequency 0–5, duration 20–90s'}), 400
-    conn = get_sqlite_connection()
-    cur = conn.cursor()
-    cur.execute('INSERT INTO contraction_entries (case_id, time, frequency, intensity, duration_seconds) VALUES (?,?,?,?,?)',
-                (case_id, t, freq, intensity, dur))
-    conn.commit(); entry_id = cur.lastrowid; conn.close()
+    with pool.acquire(write=True) as conn:
+        cur = conn.cursor()
+        cur.execute('INSERT INTO contraction_entries (case_id, time, frequency, intensity, duration_seconds) VALUES (?,?,?,?,?)',
+                    (case_id, t, freq, intensity, dur))
+        conn.commit(); entry_id = cur.lastrowid
     return jsonify({'success': True, 'id': entry_id}), 201
 
 @app.route('/api/partograph/<int:case_id>/contractions/<int:entry_id>', methods=['PUT', 'DELETE'])
@@ -1461,10 +1712,10 @@ def api_contractions_entry(case_id, entry_id):
     if request.method == 'DELETE':
         return _parto_delete(case_id, 'contraction_entries', entry_id)
     data = request.get_json(force=True)
-    conn = get_sqlite_connection()
-    conn.execute('UPDATE contraction_entries SET time=?, frequency=?, intensity=?, duration_seconds=? WHERE id=? AND case_id=?',
-                 (data.get('time'), data.get('frequency'), data.get('intensity'), data.get('duration_seconds'), entry_id, case_id))
-    conn.commit(); conn.close()
+    with pool.acquire(write=True) as conn:
+        conn.execute('UPDATE contraction_entries SET time=?, frequency=?, intensity=?, duration_seconds=? WHERE id=? AND case_id=?',
+                     (data.get('time'), data.get('frequency'), data.get('intensity'), data.get('duration_seconds'), entry_id, case_id))
+        conn.commit()
     return jsonify({'success': True})
 
 
@@ -1479,10 +1730,10 @@ def api_amniotic_fluid(case_id):
     valid = ('intact', 'clear', 'green', 'yellow', 'ruptured')
     if not t or status not in valid:
         return jsonify({'success': False, 'error': f'Status must be one of {valid}'}), 400
-    conn = get_sqlite_connection()
-    cur = conn.cursor()
-    cur.execute('INSERT INTO amniotic_fluid_entries (case_id, time, status) VALUES (?,?,?)', (case_id, t, status))
-    conn.commit(); entry_id = cur.lastrowid; conn.close()
+    with pool.acquire(write=True) as conn:
+        cur = conn.cursor()
+        cur.execute('INSERT INTO amniotic_fluid_entries (case_id, time, status) VALUES (?,?,?)', (case_id, t, status))
+        conn.commit(); entry_id = cur.lastrowid
     return jsonify({'success': True, 'id': entry_id, 'time': t, 'status': status}), 201
 
 @app.route('/api/partograph/<int:case_id>/amniotic-fluid/<int:entry_id>', methods=['PUT', 'DELETE'])
@@ -1491,10 +1742,10 @@ def api_amniotic_fluid_entry(case_id, entry_id):
     if request.method == 'DELETE':
         return _parto_delete(case_id, 'amniotic_fluid_entries', entry_id)
     data = request.get_json(force=True)
-    conn = get_sqlite_connection()
-    conn.execute('UPDATE amniotic_fluid_entries SET time=?, status=? WHERE id=? AND case_id=?',
-                 (data.get('time'), data.get('status'), entry_id, case_id))
-    conn.commit(); conn.close()
+    with pool.acquire(write=True) as conn:
+        conn.execute('UPDATE amniotic_fluid_entries SET time=?, status=? WHERE id=? AND case_id=?',
+                     (data.get('time'), data.get('status'), entry_id, case_id))
+        conn.commit()
     return jsonify({'success': True})
 
 
@@ -1511,14 +1762,14 @@ def api_vitals(case_id):
     pulse  = data.get('pulse_bpm')
     if not t:
         return jsonify({'success': False, 'error': 'time required'}), 400
-    conn = get_sqlite_connection()
-    cur = conn.cursor()
-    cur.execute('INSERT INTO vital_sign_entries (case_id, time, systolic_bp, diastolic_bp, pulse_bpm) VALUES (?,?,?,?,?)',
-                (case_id, t,
-                 int(sys_bp) if sys_bp is not None else None,
-                 int(dia_bp) if dia_bp is not None else None,
-                 int(pulse)  if pulse  is not None else None))
-    conn.commit(); entry_id = cur.lastrowid; conn.close()
+    with pool.acquire(write=True) as conn:
+        cur = conn.cursor()
+        cur.execute('INSERT INTO vital_sign_entries (case_id, time, systolic_bp, diastolic_bp, pulse_bpm) VALUES (?,?,?,?,?)',
+                    (case_id, t,
+                     int(sys_bp) if sys_bp is not None else None,
+                     int(dia_bp) if dia_bp is not None else None,
+                     int(pulse)  if pulse  is not None else None))
+        conn.commit(); entry_id = cur.lastrowid
     return jsonify({'success': True, 'id': entry_id}), 201
 
 @app.route('/api/partograph/<int:case_id>/vitals/<int:entry_id>', methods=['PUT', 'DELETE'])
@@ -1527,10 +1778,10 @@ def api_vitals_entry(case_id, entry_id):
     if request.method == 'DELETE':
         return _parto_delete(case_id, 'vital_sign_entries', entry_id)
     data = request.get_json(force=True)
-    conn = get_sqlite_connection()
-    conn.execute('UPDATE vital_sign_entries SET time=?, systolic_bp=?, diastolic_bp=?, pulse_bpm=? WHERE id=? AND case_id=?',
-                 (data.get('time'), data.get('systolic_bp'), data.get('diastolic_bp'), data.get('pulse_bpm'), entry_id, case_id))
-    conn.commit(); conn.close()
+    with pool.acquire(write=True) as conn:
+        conn.execute('UPDATE vital_sign_entries SET time=?, systolic_bp=?, diastolic_bp=?, pulse_bpm=? WHERE id=? AND case_id=?',
+                     (data.get('time'), data.get('systolic_bp'), data.get('diastolic_bp'), data.get('pulse_bpm'), entry_id, case_id))
+        conn.commit()
     return jsonify({'success': True})
 
 
@@ -1547,10 +1798,10 @@ def api_temperature(case_id):
     val = float(val)
     if not (34 <= val <= 41):
         return jsonify({'success': False, 'error': 'Temperature 34–41°C'}), 400
-    conn = get_sqlite_connection()
-    cur = conn.cursor()
-    cur.execute('INSERT INTO temperature_entries (case_id, time, celsius) VALUES (?,?,?)', (case_id, t, val))
-    conn.commit(); entry_id = cur.lastrowid; conn.close()
+    with pool.acquire(write=True) as conn:
+        cur = conn.cursor()
+        cur.execute('INSERT INTO temperature_entries (case_id, time, celsius) VALUES (?,?,?)', (case_id, t, val))
+        conn.commit(); entry_id = cur.lastrowid
     return jsonify({'success': True, 'id': entry_id, 'time': t, 'celsius': val}), 201
 
 @app.route('/api/partograph/<int:case_id>/temperature/<int:entry_id>', methods=['PUT', 'DELETE'])
@@ -1559,10 +1810,10 @@ def api_temperature_entry(case_id, entry_id):
     if request.method == 'DELETE':
         return _parto_delete(case_id, 'temperature_entries', entry_id)
     data = request.get_json(force=True)
-    conn = get_sqlite_connection()
-    conn.execute('UPDATE temperature_entries SET time=?, celsius=? WHERE id=? AND case_id=?',
-                 (data.get('time'), data.get('celsius'), entry_id, case_id))
-    conn.commit(); conn.close()
+    with pool.acquire(write=True) as conn:
+        conn.execute('UPDATE temperature_entries SET time=?, celsius=? WHERE id=? AND case_id=?',
+                     (data.get('time'), data.get('celsius'), entry_id, case_id))
+        conn.commit()
     return jsonify({'success': True})
 
 
@@ -1579,13 +1830,13 @@ def api_medications(case_id):
     route = data.get('route','').strip()
     if not all([t, mtype, dose, route]):
         return jsonify({'success': False, 'error': 'time, type, dose and route required'}), 400
-    conn = get_sqlite_connection()
-    cur = conn.cursor()
-    cur.execute(
-        'INSERT INTO medication_entries (case_id, time, medication_type, medication_name, dose, route, notes) VALUES (?,?,?,?,?,?,?)',
-        (case_id, t, mtype, data.get('medication_name',''), dose, route, data.get('notes',''))
-    )
-    conn.commit(); entry_id = cur.lastrowid; conn.close()
+    with pool.acquire(write=True) as conn:
+        cur = conn.cursor()
+        cur.execute(
+            'INSERT INTO medication_entries (case_id, time, medication_type, medication_name, dose, route, notes) VALUES (?,?,?,?,?,?,?)',
+            (case_id, t, mtype, data.get('medication_name',''), dose, route, data.get('notes',''))
+        )
+        conn.commit(); entry_id = cur.lastrowid
     return jsonify({'success': True, 'id': entry_id}), 201
 
 @app.route('/api/partograph/<int:case_id>/medications/<int:entry_id>', methods=['PUT', 'DELETE'])
@@ -1594,13 +1845,13 @@ def api_medications_entry(case_id, entry_id):
     if request.method == 'DELETE':
         return _parto_delete(case_id, 'medication_entries', entry_id)
     data = request.get_json(force=True)
-    conn = get_sqlite_connection()
-    conn.execute(
-        'UPDATE medication_entries SET time=?, medication_type=?, medication_name=?, dose=?, route=?, notes=? WHERE id=? AND case_id=?',
-        (data.get('time'), data.get('medication_type'), data.get('medication_name'),
-         data.get('dose'), data.get('route'), data.get('notes'), entry_id, case_id)
-    )
-    conn.commit(); conn.close()
+    with pool.acquire(write=True) as conn:
+        conn.execute(
+            'UPDATE medication_entries SET time=?, medication_type=?, medication_name=?, dose=?, route=?, notes=? WHERE id=? AND case_id=?',
+            (data.get('time'), data.get('medication_type'), data.get('medication_name'),
+             data.get('dose'), data.get('route'), data.get('notes'), entry_id, case_id)
+        )
+        conn.commit()
     return jsonify({'success': True})
 
 
@@ -1617,11 +1868,11 @@ def api_urine(case_id):
     vol     = data.get('volume_ml')
     if not all([t, protein, acetone]):
         return jsonify({'success': False, 'error': 'time, protein and acetone required'}), 400
-    conn = get_sqlite_connection()
-    cur = conn.cursor()
-    cur.execute('INSERT INTO urine_entries (case_id, time, protein, acetone, volume_ml) VALUES (?,?,?,?,?)',
-                (case_id, t, protein, acetone, int(vol) if vol is not None else None))
-    conn.commit(); entry_id = cur.lastrowid; conn.close()
+    with pool.acquire(write=True) as conn:
+        cur = conn.cursor()
+        cur.execute('INSERT INTO urine_entries (case_id, time, protein, acetone, volume_ml) VALUES (?,?,?,?,?)',
+                    (case_id, t, protein, acetone, int(vol) if vol is not None else None))
+        conn.commit(); entry_id = cur.lastrowid
     return jsonify({'success': True, 'id': entry_id}), 201
 
 @app.route('/api/partograph/<int:case_id>/urine/<int:entry_id>', methods=['PUT', 'DELETE'])
@@ -1630,10 +1881,10 @@ def api_urine_entry(case_id, entry_id):
     if request.method == 'DELETE':
         return _parto_delete(case_id, 'urine_entries', entry_id)
     data = request.get_json(force=True)
-    conn = get_sqlite_connection()
-    conn.execute('UPDATE urine_entries SET time=?, protein=?, acetone=?, volume_ml=? WHERE id=? AND case_id=?',
-                 (data.get('time'), data.get('protein'), data.get('acetone'), data.get('volume_ml'), entry_id, case_id))
-    conn.commit(); conn.close()
+    with pool.acquire(write=True) as conn:
+        conn.execute('UPDATE urine_entries SET time=?, protein=?, acetone=?, volume_ml=? WHERE id=? AND case_id=?',
+                     (data.get('time'), data.get('protein'), data.get('acetone'), data.get('volume_ml'), entry_id, case_id))
+        conn.commit()
     return jsonify({'success': True})
 
 
@@ -1666,207 +1917,204 @@ def _build_alerts(case_id, case, cur):
 @app.route('/api/partograph/<int:case_id>/summary')
 @login_required
 def api_partograph_summary(case_id):
-    conn = get_sqlite_connection()
-    cur = conn.cursor()
-    cur.execute('SELECT * FROM partograph_cases WHERE id = ?', (case_id,))
-    row = cur.fetchone()
-    if not row:
-        conn.close()
-        return jsonify({'error': 'Case not found'}), 404
-    case = dict(zip([d[0] for d in cur.description], row))
-
-    from datetime import datetime as dt
-    adm_dt = dt.strptime(f"{case['admission_date']} {case['admission_time']}", "%Y-%m-%d %H:%M")
-    time_in_labor_h = round((dt.now() - adm_dt).total_seconds() / 3600, 2)
+    with pool.acquire() as conn:
+        cur = conn.cursor()
+        cur.execute('SELECT * FROM partograph_cases WHERE id = ?', (case_id,))
+        row = cur.fetchone()
+        if not row:
+            return jsonify({'error': 'Case not found'}), 404
+        case = dict(row)
 
-    def latest(table, col):
-        cur.execute(f'SELECT {col} FROM {table} WHERE case_id = ? ORDER BY time DESC LIMIT 1', (case_id,))
-        r = cur.fetchone()
-        return r[0] if r else None
-
-    latest_fhr   = latest('fhr_entries', 'fhr_value')
-    latest_cervix = latest('cervix_entries', 'dilatation_cm')
-    latest_pulse = latest('vital_sign_entries', 'pulse_bpm')
-    latest_sys   = latest('vital_sign_entries', 'systolic_bp')
-    latest_dia   = latest('vital_sign_entries', 'diastolic_bp')
-    latest_temp  = latest('temperature_entries', 'celsius')
-
-    # Cervical change rate
-    cur.execute('SELECT dilatation_cm, time FROM cervix_entries WHERE case_id = ? ORDER BY time', (case_id,))
-    cx_rows = cur.fetchall()
-    rate = None
-    if len(cx_rows) >= 2:
-        try:
-            t1 = dt.strptime(f"{case['admission_date']} {cx_rows[-2][1]}", "%Y-%m-%d %H:%M")
-            t2 = dt.strptime(f"{case['admission_date']} {cx_rows[-1][1]}", "%Y-%m-%d %H:%M")
-            diff_h = (t2 - t1).total_seconds() / 3600
-            if diff_h > 0:
-                rate = round((cx_rows[-1][0] - cx_rows[-2][0]) / diff_h, 2)
-        except Exception:
-            pass
-
-    # Status badge
-    badge = 'normal'
-    if latest_cervix is not None:
-        hrs = _hours_elapsed(case['admission_date'], case['admission_time'],
-                             cx_rows[-1][1] if cx_rows else case['admission_time'])
-        alert_line = 4 + 0.5 * hrs
-        action_line = alert_line + 1
-        if latest_cervix >= action_line:
-            badge = 'action'
-        elif latest_cervix >= alert_line:
-            badge = 'alert'
+        from datetime import datetime as dt
+        adm_dt = dt.strptime(f"{case['admission_date']} {case['admission_time']}", "%Y-%m-%d %H:%M")
+        time_in_labor_h = round((dt.now() - adm_dt).total_seconds() / 3600, 2)
+
+        def latest(table, col):
+            cur.execute(f'SELECT {col} FROM {table} WHERE case_id = ? ORDER BY time DESC LIMIT 1', (case_id,))
+            r = cur.fetchone()
+            return r[0] if r else None
+
+        latest_fhr   = latest('fhr_entries', 'fhr_value')
+        latest_cervix = latest('cervix_entries', 'dilatation_cm')
+        latest_pulse = latest('vital_sign_entries', 'pulse_bpm')
+        latest_sys   = latest('vital_sign_entries', 'systolic_bp')
+        latest_dia   = latest('vital_sign_entries', 'diastolic_bp')
+        latest_temp  = latest('temperature_entries', 'celsius')
+
+        # Cervical change rate
+        cur.execute('SELECT dilatation_cm, time FROM cervix_entries WHERE case_id = ? ORDER BY time', (case_id,))
+        cx_rows = cur.fetchall()
+        rate = None
+        if len(cx_rows) >= 2:
+            try:
+                t1 = dt.strptime(f"{case['admission_date']} {cx_rows[-2][1]}", "%Y-%m-%d %H:%M")
+                t2 = dt.strptime(f"{case['admission_date']} {cx_rows[-1][1]}", "%Y-%m-%d %H:%M")
+                diff_h = (t2 - t1).total_seconds() / 3600
+                if diff_h > 0:
+                    rate = round((cx_rows[-1][0] - cx_rows[-2][0]) / diff_h, 2)
+            except Exception:
+                pass
 
-    conn.close()
-    return jsonify({
-        'success': True,
-        'time_in_labor_hours': time_in_labor_h,
-        'latest_fhr': latest_fhr,
-        'latest_cervical_dilatation': latest_cervix,
-        'cervical_change_rate': rate,
-        'latest_systolic_bp': latest_sys,
-        'latest_diastolic_bp': latest_dia,
-        'latest_pulse': latest_pulse,
-        'latest_temperature': latest_temp,
-        'status_badge': badge,
-        # ── extra fields used by inline patient-detail panel ──
-        'status':         case['status'],
-        'duration_hours': time_in_labor_h,
-        'fhr_count':      cur.execute('SELECT COUNT(*) FROM fhr_entries WHERE case_id=?',(case_id,)).fetchone()[0],
-        'cervix_count':   cur.execute('SELECT COUNT(*) FROM cervix_entries WHERE case_id=?',(case_id,)).fetchone()[0],
-        'vitals_count':   cur.execute('SELECT COUNT(*) FROM vital_sign_entries WHERE case_id=?',(case_id,)).fetchone()[0],
-        'alerts':         _build_alerts(case_id, case, cur),
-    })
+        # Status badge
+        badge = 'normal'
+        if latest_cervix is not None:
+            hrs = _hours_elapsed(case['admission_date'], case['admission_time'],
+                                 cx_rows[-1][1] if cx_rows else case['admission_time'])
+            alert_line = 4 + 0.5 * hrs
+            action_line = alert_line + 1
+            if latest_cervix >= action_line:
+                badge = 'action'
+            elif latest_cervix >= alert_line:
+                badge = 'alert'
+
+        return jsonify({
+            'success': True,
+            'time_in_labor_hours': time_in_labor_h,
+            'latest_fhr': latest_fhr,
+            'latest_cervical_dilatation': latest_cervix,
+            'cervical_change_rate': rate,
+            'latest_systolic_bp': latest_sys,
+            'latest_diastolic_bp': latest_dia,
+            'latest_pulse': latest_pulse,
+            'latest_temperature': latest_temp,
+            'status_badge': badge,
+            # ── extra fields used by inline patient-detail panel ──
+            'status':         case['status'],
+            'duration_hours': time_in_labor_h,
+            'fhr_count':      cur.execute('SELECT COUNT(*) FROM fhr_entries WHERE case_id=?',(case_id,)).fetchone()[0],
+            'cervix_count':   cur.execute('SELECT COUNT(*) FROM cervix_entries WHERE case_id=?',(case_id,)).fetchone()[0],
+            'vitals_count':   cur.execute('SELECT COUNT(*) FROM vital_sign_entries WHERE case_id=?',(case_id,)).fetchone()[0],
+            'alerts':         _build_alerts(case_id, case, cur),
+        })
 
 
 @app.route('/api/partograph/<int:case_id>/alerts')
 @login_required
 def api_partograph_alerts(case_id):
-    conn = get_sqlite_connection()
-    cur = conn.cursor()
-    cur.execute('SELECT * FROM partograph_cases WHERE id = ?', (case_id,))
-    row = cur.fetchone()
-    if not row:
-        conn.close()
-        return jsonify({'error': 'Case not found'}), 404
-    case = dict(zip([d[0] for d in cur.description], row))
+    with pool.acquire() as conn:
+        cur = conn.cursor()
+        cur.execute('SELECT * FROM partograph_cases WHERE id = ?', (case_id,))
+        row = cur.fetchone()
+        if not row:
+            return jsonify({'error': 'Case not found'}), 404
+        case = dict(row)
 
-    alerts = {'critical': [], 'warning': [], 'info': []}
+        alerts = {'critical': [], 'warning': [], 'info': []}
 
-    def add(level, msg):
-        alerts[level].append({'message': msg})
+        def add(level, msg):
+            alerts[level].append({'message': msg})
 
-    # FHR
-    cur.execute('SELECT fhr_value FROM fhr_entries WHERE case_id = ? ORDER BY time DESC LIMIT 1', (case_id,))
-    r = cur.fetchone()
-    if r:
-        if r[0] > 160: add('warning', f'⚠️ Fetal tachycardia: {r[0]} bpm (>160)')
-        elif r[0] < 120: add('warning', f'⚠️ Fetal bradycardia: {r[0]} bpm (<120)')
+        # FHR
+        cur.execute('SELECT fhr_value FROM fhr_entries WHERE case_id = ? ORDER BY time DESC LIMIT 1', (case_id,))
+        r = cur.fetchone()
+        if r:
+            if r[0] > 160: add('warning', f'⚠️ Fetal tachycardia: {r[0]} bpm (>160)')
+            elif r[0] < 120: add('warning', f'⚠️ Fetal bradycardia: {r[0]} bpm (<120)')
 
-    # Amniotic fluid
-    cur.execute("SELECT status FROM amniotic_fluid_entries WHERE case_id = ? ORDER BY time DESC LIMIT 1", (case_id,))
-    r = cur.fetchone()
-    if r and r[0] in ('green', 'yellow'):
-        add('warning', '⚠️ Meconium staining detected. Increase fetal monitoring.')
+        # Amniotic fluid
+        cur.execute("SELECT status FROM amniotic_fluid_entries WHERE case_id = ? ORDER BY time DESC LIMIT 1", (case_id,))
+        r = cur.fetchone()
+        if r and r[0] in ('green', 'yellow'):
+            add('warning', '⚠️ Meconium staining detected. Increase fetal monitoring.')
 
-    # Vitals
-    cur.execute('SELECT systolic_bp, diastolic_bp, pulse_bpm FROM vital_sign_entries WHERE case_id = ? ORDER BY time DESC LIMIT 1', (case_id,))
-    r = cur.fetchone()
-    if r:
-        sys_bp, dia_bp, pulse = r
-        if sys_bp and dia_bp:
-            if sys_bp > 160 or dia_bp > 110:
-                add('critical', f'🔴 SEVERE HYPERTENSION {sys_bp}/{dia_bp}. Risk of eclampsia.')
-            elif sys_bp < 90 or dia_bp < 60:
-                add('warning', f'⚠️ Hypotension {sys_bp}/{dia_bp}. Check for bleeding.')
-        if pulse and pulse > 110:
-            add('warning', f'⚠️ Maternal tachycardia: {pulse} bpm.')
-
-    # Temperature
-    cur.execute('SELECT celsius FROM temperature_entries WHERE case_id = ? ORDER BY time DESC LIMIT 1', (case_id,))
-    r = cur.fetchone()
-    if r and r[0] > 38.0:
-        add('warning', f'⚠️ FEVER: {r[0]}°C. Assess for chorioamnionitis.')
+        # Vitals
+        cur.execute('SELECT systolic_bp, diastolic_bp, pulse_bpm FROM vital_sign_entries WHERE case_id = ? ORDER BY time DESC LIMIT 1', (case_id,))
+        r = cur.fetchone()
+        if r:
+            sys_bp, dia_bp, pulse = r
+            if sys_bp and dia_bp:
+                if sys_bp > 160 or dia_bp > 110:
+                    add('critical', f'🔴 SEVERE HYPERTENSION {sys_bp}/{dia_bp}. Risk of eclampsia.')
+                elif sys_bp < 90 or dia_bp < 60:
+                    add('warning', f'⚠️ Hypotension {sys_bp}/{dia_bp}. Check for bleeding.')
+            if pulse and pulse > 110:
+                add('warning', f'⚠️ Maternal tachycardia: {pulse} bpm.')
+
+        # Temperature
+        cur.execute('SELECT celsius FROM temperature_entries WHERE case_id = ? ORDER BY time DESC LIMIT 1', (case_id,))
+        r = cur.fetchone()
+        if r and r[0] > 38.0:
+            add('warning', f'⚠️ FEVER: {r[0]}°C. Assess for chorioamnionitis.')
 
-    # Contractions
-    cur.execute('SELECT frequency, intensity FROM contraction_entries WHERE case_id = ? ORDER BY time DESC LIMIT 1', (case_id,))
-    r = cur.fetchone()
-    if r:
-        if r[0] < 2: add('warning', '⚠️ Inadequate contractions (<2/10 min). Consider oxytocin.')
+        # Contractions
+        cur.execute('SELECT frequency, intensity FROM contraction_entries WHERE case_id = ? ORDER BY time DESC LIMIT 1', (case_id,))
+        r = cur.fetchone()
+        if r:
+            if r[0] < 2: add('warning', '⚠️ Inadequate contractions (<2/10 min). Consider oxytocin.')
 
-    # Urine
-    cur.execute("SELECT protein FROM urine_entries WHERE case_id = ? ORDER BY time DESC LIMIT 1", (case_id,))
-    r = cur.fetchone()
-    if r and r[0] in ('++', '+++'):
-        add('warning', f'⚠️ Significant proteinuria ({r[0]}). Monitor for preeclampsia.')
+        # Urine
+        cur.execute("SELECT protein FROM urine_entries WHERE case_id = ? ORDER BY time DESC LIMIT 1", (case_id,))
+        r = cur.fetchone()
+        if r and r[0] in ('++', '+++'):
+            add('warning', f'⚠️ Significant proteinuria ({r[0]}). Monitor for preeclampsia.')
 
-    # Moulding + cervix
-    cur.execute("SELECT grade FROM moulding_entries WHERE case_id = ? ORDER BY time DESC LIMIT 1", (case_id,))
-    mr = cur.fetchone()
-    cur.execute('SELECT dilatation_cm, time FROM cervix_entries WHERE case_id = ? ORDER BY time', (case_id,))
-    cx = cur.fetchall()
-    if mr and mr[0] == '+++' and len(cx) >= 2:
-        add('critical', '🔴 SEVERE MOULDING + SLOW PROGRESS. High risk of CPD.')
+        # Moulding + cervix
+        cur.execute("SELECT grade FROM moulding_entries WHERE case_id = ? ORDER BY time DESC LIMIT 1", (case_id,))
+        mr = cur.fetchone()
+        cur.execute('SELECT dilatation_cm, time FROM cervix_entries WHERE case_id = ? ORDER BY time', (case_id,))
+        cx = cur.fetchall()
+        if mr and mr[0] == '+++' and len(cx) >= 2:
+            add('critical', '🔴 SEVERE MOULDING + SLOW PROGRESS. High risk of CPD.')
 
-    if not alerts['critical'] and not alerts['warning']:
-        add('info', '✅ No active alerts. Labor appears to be progressing normally.')
+        if not alerts['critical'] and not alerts['warning']:
+            add('info', '✅ No active alerts. Labor appears to be progressing normally.')
 
-    conn.close()
-    return jsonify({'success': True, 'alerts': alerts})
+        return jsonify({'success': True, 'alerts': alerts})
 
 
 # ─── CSV Export ───────────────────────────────────────────────────────────────
 @app.route('/api/partograph/<int:case_id>/export/csv')
 @login_required
 def api_partograph_export_csv(case_id):
-    conn = get_sqlite_connection()
-    cur = conn.cursor()
-    cur.execute('SELECT * FROM partograph_cases WHERE id = ?', (case_id,))
-    row = cur.fetchone()
-    if not row:
-        conn.close()
-        return jsonify({'error': 'Not found'}), 404
-    case = dict(zip([d[0] for d in cur.description], row))
-
-    output = io.StringIO()
-    w = csv.writer(output)
-    w.writerow(['SaveTheMommy — Partograph Export'])
-    w.writerow(['Patient UUID', case['patient_uuid']])
-    w.writerow(['Admission Date', case['admission_date']])
-    w.writerow(['Admission Time', case['admission_time']])
-    w.writerow([])
-
-    for table, label, cols in [
-        ('fhr_entries', 'FHR', ['time','fhr_value']),
-        ('cervix_entries', 'Cervical Dilatation', ['time','dilatation_cm']),
-        ('descent_entries', 'Head Descent', ['time','descent_value']),
-        ('moulding_entries', 'Moulding', ['time','grade']),
-        ('contraction_entries', 'Contractions', ['time','frequency','intensity','duration_seconds']),
-        ('amniotic_fluid_entries', 'Amniotic Fluid', ['time','status']),
-        ('vital_sign_entries', 'Vital Signs', ['time','systolic_bp','diastolic_bp','pulse_bpm']),
-        ('temperature_entries', 'Temperature', ['time','celsius']),
-        ('medication_entries', 'Medications', ['time','medication_type','medication_name','dose','route']),
-        ('urine_entries', 'Urine', ['time','protein','acetone','volume_ml']),
-    ]:
-        cur.execute(f'SELECT {",".join(cols)} FROM {table} WHERE case_id = ? ORDER BY time', (case_id,))
-        rows = cur.fetchall()
-        w.writerow([label])
-        w.writerow(cols)
-        for r in rows:
-            w.writerow(r)
+    with pool.acquire() as conn:
+        cur = conn.cursor()
+        cur.execute('SELECT * FROM partograph_cases WHERE id = ?', (case_id,))
+        row = cur.fetchone()
+        if not row:
+            return jsonify({'error': 'Not found'}), 404
+        case = dict(row)
+
+        output = io.StringIO()
+        w = csv.writer(output)
+        w.writerow(['SaveTheMommy — Partograph Export'])
+        w.writerow(['Patient UUID', case['patient_uuid']])
+        w.writerow(['Admission Date', case['admission_date']])
+        w.writerow(['Admission Time', case['admission_time']])
         w.writerow([])
 
-    conn.close()
-    output.seek(0)
-    return send_file(
-        io.BytesIO(output.getvalue().encode('utf-8')),
-        mimetype='text/csv',
-        as_attachment=True,
-        download_name=f'partograph_{case_id}_{case["admission_date"]}.csv'
-    )
+        for table, label, cols in [
+            ('fhr_entries', 'FHR', ['time','fhr_value']),
+            ('cervix_entries', 'Cervical Dilatation', ['time','dilatation_cm']),
+            ('descent_entries', 'Head Descent', ['time','descent_value']),
+            ('moulding_entries', 'Moulding', ['time','grade']),
+            ('contraction_entries', 'Contractions', ['time','frequency','intensity','duration_seconds']),
+            ('amniotic_fluid_entries', 'Amniotic Fluid', ['time','status']),
+            ('vital_sign_entries', 'Vital Signs', ['time','systolic_bp','diastolic_bp','pulse_bpm']),
+            ('temperature_entries', 'Temperature', ['time','celsius']),
+            ('medication_entries', 'Medications', ['time','medication_type','medication_name','dose','route']),
+            ('urine_entries', 'Urine', ['time','protein','acetone','volume_ml']),
+        ]:
+            cur.execute(f'SELECT {",".join(cols)} FROM {table} WHERE case_id = ? ORDER BY time', (case_id,))
+            rows = cur.fetchall()
+            w.writerow([label])
+            w.writerow(cols)
+            for r in rows:
+                w.writerow(r)
+            w.writerow([])
+
+        output.seek(0)
+        return send_file(
+            io.BytesIO(output.getvalue().encode('utf-8')),
+            mimetype='text/csv',
+            as_attachment=True,
+            download_name=f'partograph_{case_id}_{case["admission_date"]}.csv'
+        )
 
 
 
+# Local development only. Deployments run threaded gunicorn workers, e.g.
+#   gunicorn app:app --workers 2 --worker-class gthread --threads 8 --keep-alive 5
+# (see Procfile / railway.toml / render.yaml)
 if __name__ == '__main__':
     logger.info("=" * 60)
     logger.info("Starting SaveTheMommy MediCare - MVP 1")
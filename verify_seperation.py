@@ -7,8 +7,14 @@ Checks that no personal data exists in Firebase
 import sqlite3
 import firebase_admin
 from firebase_admin import credentials, firestore
+from google.cloud.firestore_v1.base_query import FieldFilter
 import os
 import json
+from itertools import islice
+
+PERSONAL_FIELDS = frozenset({'full_name', 'name', 'phone', 'email', 'contact', 'address'})
+MEDICAL_FIELDS = frozenset({'age', 'height', 'medical_history', 'vital_signs', 'risk_metrics'})
+BATCH_GET_LIMIT = 500  # max document references per get_all() call
 
 def verify_data_separation():
     print("=" * 60)
@@ -20,15 +26,29 @@ def verify_data_separation():
     conn = sqlite3.connect('db_local.sqlite')
     cursor = conn.cursor()
     
-    # Get all patients
-    cursor.execute('SELECT uuid, full_name, phone, email FROM patients')
-    patients = cursor.fetchall()
+    # One read transaction: every query below sees the same snapshot
+    with conn:
+        cursor.execute('BEGIN')
+        
+        cursor.execute('SELECT COUNT(*) FROM patients')
+        patient_count = cursor.fetchone()[0]
+        
+        # Only the first 3 rows are displayed, so only fetch those
+        cursor.execute('SELECT uuid, full_name, phone, email FROM patients LIMIT 3')
+        sample_patients = cursor.fetchall()
+        
+        # UUIDs for the linkage check, built straight from the cursor
+        sqlite_uuids = {row[0] for row in cursor.execute('SELECT uuid FROM patients')}
+        
+        # Check for medical data in SQLite (should be none)
+        cursor.execute("PRAGMA table_info(patients)")
+        columns = [col[1] for col in cursor.fetchall()]
     
-    print(f"   Found {len(patients)} patients in SQLite (personal data only)")
+    print(f"   Found {patient_count} patients in SQLite (personal data only)")
     
-    if patients:
+    if sample_patients:
         print("   Sample patient data (personal info only):")
-        for i, (uuid, name, phone, email) in enumerate(patients[:3]):  # Show first 3
+        for i, (uuid, name, phone, email) in enumerate(sample_patients):
             print(f"   Patient {i+1}:")
             print(f"     UUID: {uuid}")
             print(f"     Name: {name}")
@@ -36,9 +56,6 @@ def verify_data_separation():
             print(f"     Email: {email}")
             print()
     
-    # Check for medical data in SQLite (should be none)
-    cursor.execute("PRAGMA table_info(patients)")
-    columns = [col[1] for col in cursor.fetchall()]
     medical_columns = ['age', 'height', 'medical', 'risk', 'blood', 'glucose', 'weight', 'bmi']
     
     medical_fields_found = []
@@ -61,40 +78,45 @@ def verify_data_separation():
             cred = credentials.Certificate('firebase_key.json')
             firebase_admin.initialize_app(cred)
             db = firestore.client()
+            medical_col = db.collection('patients_medical')
+            
+            # Server-side count: a single aggregation read
+            firebase_count = medical_col.count().get()[0][0].value
             
-            # Get all medical documents
-            docs = list(db.collection('patients_medical').stream())
+            # Only fetch the fields this audit inspects
+            audit_fields = ['uuid', *MEDICAL_FIELDS]
+            docs = list(medical_col.select(audit_fields).stream())
             
-            print(f"   Found {len(docs)} medical records in Firebase")
+            print(f"   Found {firebase_count} medical records in Firebase")
             
             personal_data_found = False
             personal_fields_detected = []
             
             print("   Checking for personal data in Firebase...")
+            # One server-side existence probe per personal field (at most one read each)
+            for field in sorted(PERSONAL_FIELDS):
+                hits = medical_col.where(filter=FieldFilter(field, '!=', None)).limit(1).get()
+                if hits:
+                    personal_data_found = True
+                    personal_fields_detected.append(field)
+                    print(f"   ⚠️  SECURITY BREACH: Personal field '{field}' found in Firebase! (e.g. {hits[0].id})")
+            
+            # Firebase UUIDs for the linkage check, collected in the same pass
+            firebase_uuids = set()
             for doc in docs:
                 data = doc.to_dict()
                 
-                # Check for personal identifiers in Firebase
-                personal_fields = ['full_name', 'name', 'phone', 'email', 'contact', 'address']
-                for field in personal_fields:
-                    if field in data:
-                        personal_data_found = True
-                        personal_fields_detected.append(field)
-                        print(f"   ⚠️  SECURITY BREACH: Personal field '{field}' found in Firebase!")
-                
                 # Check that UUID exists
                 if 'uuid' not in data:
                     print(f"   ⚠️  WARNING: Document missing UUID!")
                 else:
+                    firebase_uuids.add(data['uuid'])
                     # Verify UUID format (should be 36 chars for UUID4)
                     if len(data['uuid']) != 36:
                         print(f"   ⚠️  WARNING: UUID format suspicious: {data['uuid']}")
                 
                 # Check for anonymous medical data
-                medical_fields = ['age', 'height', 'medical_history', 'vital_signs', 'risk_metrics']
-                medical_present = [field for field in medical_fields if field in data]
-                
-                if not medical_present:
+                if MEDICAL_FIELDS.isdisjoint(data):
                     print(f"   ⚠️  WARNING: Document has no medical data: {doc.id}")
             
             if not personal_data_found:
@@ -104,35 +126,36 @@ def verify_data_separation():
             
             # Check linkage between databases
             print("\n3. Checking database linkage...")
-            if patients and len(docs) > 0:
-                # Get UUIDs from both databases
-                sqlite_uuids = [p[0] for p in patients]
-                
-                firebase_uuids = []
-                for doc in docs:
-                    data = doc.to_dict()
-                    if 'uuid' in data:
-                        firebase_uuids.append(data['uuid'])
-                
-                # Check for orphans
-                sqlite_only = set(sqlite_uuids) - set(firebase_uuids)
-                firebase_only = set(firebase_uuids) - set(sqlite_uuids)
+            if sqlite_uuids and docs:
+                # Check for orphans (both UUID sets were collected above)
+                sqlite_only = sqlite_uuids - firebase_uuids
+                firebase_only = firebase_uuids - sqlite_uuids
                 
                 if sqlite_only:
                     print(f"   ⚠️  {len(sqlite_only)} patients in SQLite without Firebase medical records")
-                    for uuid in list(sqlite_only)[:3]:
+                    for uuid in islice(sqlite_only, 3):
                         print(f"      - {uuid}")
                     if len(sqlite_only) > 3:
                         print(f"      ... and {len(sqlite_only) - 3} more")
+                    
+                    # Look the orphans up by document ID to tell a missing document
+                    # from one whose uuid field is missing; one batched RPC per chunk
+                    orphan_ids = sorted(sqlite_only)
+                    missing_docs = 0
+                    for start in range(0, len(orphan_ids), BATCH_GET_LIMIT):
+                        refs = [medical_col.document(u) for u in orphan_ids[start:start + BATCH_GET_LIMIT]]
+                        missing_docs += sum(1 for snap in db.get_all(refs, field_paths=['uuid']) if not snap.exists)
+                    print(f"      {missing_docs} have no Firebase document, "
+                          f"{len(orphan_ids) - missing_docs} have a document with a missing or mismatched uuid field")
                 
                 if firebase_only:
                     print(f"   ⚠️  {len(firebase_only)} Firebase medical records without SQLite patients")
-                    for uuid in list(firebase_only)[:3]:
+                    for uuid in islice(firebase_only, 3):
                         print(f"      - {uuid}")
                     if len(firebase_only) > 3:
                         print(f"      ... and {len(firebase_only) - 3} more")
                 
-                linked_count = len(set(sqlite_uuids) & set(firebase_uuids))
+                linked_count = len(sqlite_uuids) - len(sqlite_only)
                 print(f"   ✓ {linked_count} patients properly linked between databases")
                 
                 if not sqlite_only and not firebase_only:
@@ -152,8 +175,8 @@ def verify_data_separation():
     print("=" * 60)
     
     summary = {
-        "sqlite_patients": len(patients),
-        "firebase_medical_records": len(docs) if 'docs' in locals() else 0,
+        "sqlite_patients": patient_count,
+        "firebase_medical_records": firebase_count if 'firebase_count' in locals() else 0,
         "medical_in_sqlite": len(medical_fields_found) > 0,
         "personal_in_firebase": personal_data_found if 'personal_data_found' in locals() else False,
         "linkage_issues": (len(sqlite_only) > 0 or len(firebase_only) > 0) if 'sqlite_only' in locals() else False